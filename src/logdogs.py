@@ -9,11 +9,20 @@ import os
 import sys
 import re
 import time
+import errno
+import json
+import struct
+import zlib
+import socket
+import heapq
+import math
+import itertools
 import logging
 import traceback
 import atexit
-from collections import defaultdict
-from stat import ST_DEV, ST_INO
+from collections import defaultdict, OrderedDict, deque
+from timeit import default_timer
+from stat import ST_DEV, ST_INO, S_ISSOCK
 from email.mime.text import MIMEText
 from smtplib import SMTP, SMTP_SSL
 
@@ -24,17 +33,118 @@ from daemon import DaemonContext, pidfile
 
 logger = logging.getLogger(__name__)
 
+# schedules are not affected by changes of the system time, time.time is only for canary timestamps
+clock = getattr(time, 'monotonic', time.time)
 
-class Log(object):
+
+class Source(object):
     """
-    a log file is represented by a Log object
+    lines are read from a source and processed by dogs
+    path is the name of the source which is passed to handlers as file
     """
-    def __init__(self, path, dogs, new=False):
+    def __init__(self, path, dogs):
         self.path = path
         self.dogs = dogs
         self.total = 0
         self.half = None
         self.old = False
+        self.interval = None # seconds until next poll
+        self.history = deque(maxlen=0) # last lines for context before matches
+
+    def __repr__(self):
+        return '<%s path=%s, dogs=%s>' % (self.__class__.__name__, self.path, self.dogs)
+
+    def readlines(self):
+        """
+        read all lines since last time without blocking
+        """
+        raise NotImplementedError
+
+    def backlog(self):
+        """
+        number of bytes appended but not read yet, unknown for most sources
+        """
+        return 0
+
+    def skip(self):
+        """
+        discard what has not been read yet and return number of bytes skipped
+        """
+        return 0
+
+    def check(self):
+        """
+        called after each process to set old if the source is gone
+        """
+        pass
+
+    def fileno(self):
+        raise NotImplementedError
+
+    def process(self, overload=None, probe=None):
+        """
+        if log file has been appended, call dogs to process
+        """
+        if overload:
+            lines = overload.shed(self)
+        else:
+            lines = self.readlines()
+        canaries = []
+        if probe and lines:
+            read = time.time()
+            canaries = [line for line in lines if probe.is_canary(line)]
+            if canaries:
+                # hidden from dogs
+                lines = [line for line in lines if not probe.is_canary(line)]
+        self.total += len(lines)
+        logger.debug('%s process %d/%d lines' % (self, len(lines), self.total))
+        if lines:
+            # dogs may be added after the log is created
+            n = max(dog.before for dog in self.dogs)
+            if n != self.history.maxlen:
+                self.history = deque(self.history, maxlen=n)
+            history = list(self.history) if n else []
+            for dog in self.dogs:
+                if overload:
+                    dog.process(self.path, overload.sample_lines(dog, self.path, lines), history, self)
+                else:
+                    dog.process(self.path, lines, history, self)
+            self.history.extend(lines)
+        for line in canaries:
+            probe.measure(self.path, line, read)
+        self.check()
+        # return number of rows
+        return len(lines)
+
+    def latency(self, default):
+        """
+        return the strictest (min_latency, max_latency) among all dogs watching this log
+        """
+        lo = min(default if dog.min_latency is None else dog.min_latency for dog in self.dogs)
+        hi = min(default if dog.max_latency is None else dog.max_latency for dog in self.dogs)
+        return lo, max(lo, hi)
+
+    def reschedule(self, n, default):
+        """
+        poll a hot log at min latency and back a cold log off exponentially up to max latency
+        """
+        lo, hi = self.latency(default)
+        if n or self.interval is None:
+            self.interval = lo
+        else:
+            self.interval = min(max(self.interval * 2, lo), hi)
+        return self.interval
+
+    def close(self):
+        pass
+
+
+class Log(Source):
+    """
+    a log file is represented by a Log object
+    """
+    def __init__(self, path, dogs, new=False):
+        super(Log, self).__init__(path, dogs)
         self.f = open(path)
         sres = os.fstat(self.f.fileno())
         self.dev, self.ino = sres[ST_DEV], sres[ST_INO]
@@ -43,9 +153,6 @@ class Log(object):
             # ignore old logs
             self.f.seek(0, 2) # seek to the end
 
-    def __repr__(self):
-        return '<%s path=%s, dogs=%s>' % (self.__class__.__name__, self.path, self.dogs)
-
     def readlines(self):
         """
         tail all lines since last time
@@ -68,50 +175,373 @@ class Log(object):
                 break
         return lines
 
-    def process(self):
+    def backlog(self):
         """
-        if log file has been appended, call dogs to process
+        number of bytes appended but not read yet
         """
-        lines = self.readlines()
-        self.total += len(lines)
-        logger.debug('%s process %d/%d lines' % (self, len(lines), self.total))
-        if lines:
-            for dog in self.dogs:
-                dog.process(self.path, lines)
-        # check rotate
+        return max(0, os.fstat(self.f.fileno()).st_size - self.f.tell())
+
+    def skip(self):
+        """
+        jump to the end of the file and return number of bytes skipped
+        """
+        n = self.backlog()
+        self.f.seek(0, 2)
+        self.half = None
+        return n
+
+    def check(self):
+        """
+        check rotate
+        """
+        sres = None
         try:
             # stat the file by path, checking for existence
             sres = os.stat(self.path)
         except OSError as err:
-            if err.errno == errno.ENOENT:
-                sres = None
-            else:
+            if err.errno != errno.ENOENT:
                 logger.error('\n'+traceback.format_exc())
         if not sres or sres[ST_DEV] != self.dev or sres[ST_INO] != self.ino:
             logger.warning('%s is moved' % self)
             self.old = True
-        # return number of rows
-        return len(lines)
+
+    def fileno(self):
+        return self.f.fileno()
 
     def close(self):
         # is this necessary?
         self.f.close()
 
 
+class StreamSource(Source):
+    """
+    split received bytes into lines, a line longer than max_line is cut
+    at most batch lines are read in a loop, the rest is left in the kernel buffer
+    """
+    def __init__(self, path, dogs, batch=10000, max_line=65536):
+        super(StreamSource, self).__init__(path, dogs)
+        self.batch = batch
+        self.max_line = max_line
+
+    def split(self, data, half):
+        """
+        return (complete lines, half line) of bytes following the half line
+        half line is None when the rest of a line longer than max_line is being discarded
+        """
+        lines = data.split(b'\n')
+        if half is None:
+            if len(lines) == 1:
+                return [], None
+            # the end of the cut line
+            lines.pop(0)
+            half = b''
+        lines[0] = half + lines[0]
+        half = lines.pop()
+        if len(half) >= self.max_line:
+            lines.append(half)
+            half = None
+        return [line[:self.max_line].decode('utf-8', 'replace') + '\n' for line in lines], half
+
+
+class SyslogSource(StreamSource):
+    """
+    receive syslog messages from a udp, tcp or unix datagram socket
+    tcp messages are framed by newline
+    """
+    def __init__(self, path, dogs, batch=10000, max_line=65536):
+        super(SyslogSource, self).__init__(path, dogs, batch, max_line)
+        self.clients = {} # {tcp client socket: half line}
+        scheme, address = path.split('://', 1)
+        if scheme == 'unix':
+            if os.path.exists(address):
+                self.remove_stale(address)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.address = address
+        else:
+            host, port = address.rsplit(':', 1)
+            address = (host, int(port))
+            if scheme == 'udp':
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            else:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.address = None
+        self.scheme = scheme
+        self.sock.bind(address)
+        if scheme == 'tcp':
+            self.sock.listen(128)
+        self.sock.setblocking(False)
+        logger.info('watch %s' % self)
+
+    def remove_stale(self, address):
+        """
+        remove a unix socket left by a previous run
+        raise ValueError if it's not a socket or it's still in use
+        """
+        if not S_ISSOCK(os.stat(address).st_mode):
+            raise ValueError('%s exists and is not a socket' % address)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            s.connect(address)
+        except socket.error as err:
+            if err.errno != errno.ECONNREFUSED:
+                raise
+            os.remove(address)
+        else:
+            raise ValueError('%s is in use' % address)
+        finally:
+            s.close()
+
+    def readlines(self):
+        if self.scheme == 'tcp':
+            return self.read_stream()
+        lines = []
+        while len(lines) < self.batch:
+            try:
+                data = self.sock.recv(self.max_line)
+            except socket.error as err:
+                if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            # a datagram is a message
+            lines.append(data.decode('utf-8', 'replace').rstrip('\n') + '\n')
+        return lines
+
+    def read_stream(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error as err:
+                if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            logger.info('%s accept %s' % (self, addr))
+            conn.setblocking(False)
+            self.clients[conn] = b''
+        lines = []
+        for conn in list(self.clients):
+            while len(lines) < self.batch:
+                try:
+                    data = conn.recv(self.max_line)
+                except socket.error as err:
+                    if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    data = b''
+                if not data:
+                    # closed by client, the half line is dropped
+                    del self.clients[conn]
+                    conn.close()
+                    break
+                new, self.clients[conn] = self.split(data, self.clients[conn])
+                lines.extend(new)
+        return lines
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        for conn in self.clients:
+            conn.close()
+        self.clients = {}
+        self.sock.close()
+        if self.address and os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class FifoSource(StreamSource):
+    """
+    read lines from a named pipe which is created if not exists
+    """
+    def __init__(self, path, dogs, batch=10000, max_line=65536):
+        super(FifoSource, self).__init__(path, dogs, batch, max_line)
+        self.half = b''
+        address = path.split('://', 1)[1]
+        if not os.path.exists(address):
+            os.mkfifo(address)
+        # non-blocking open doesn't wait for a writer
+        self.fd = os.open(address, os.O_RDONLY | os.O_NONBLOCK)
+        logger.info('watch %s' % self)
+
+    def readlines(self):
+        lines = []
+        while len(lines) < self.batch:
+            try:
+                data = os.read(self.fd, self.max_line)
+            except OSError as err:
+                if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not data:
+                # no writer
+                break
+            new, self.half = self.split(data, self.half)
+            lines.extend(new)
+        return lines
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def source(url, dogs):
+    """
+    create a source by the scheme of url:
+    udp://host:port, tcp://host:port, unix:///path/to/socket or fifo:///path/to/pipe
+    """
+    scheme = url.split('://', 1)[0]
+    if scheme in ('udp', 'tcp', 'unix'):
+        return SyslogSource(url, dogs)
+    elif scheme == 'fifo':
+        return FifoSource(url, dogs)
+    raise ValueError('unknown source %s' % url)
+
+
+class Pattern(object):
+    """
+    a compiled regex which records the time spent on searching
+    only searches of the lines sampled by its filter are counted and timed
+    """
+    def __init__(self, pattern, slow=None, strikes=None, filter=None, cooldown=300):
+        self.pattern = pattern
+        self.re = re.compile(pattern)
+        self.find = self.re.search # searching without timing
+        self.slow = slow # seconds, a search taking longer is slow
+        self.strikes = strikes # disable the pattern after so many slow searches in a row
+        self.cooldown = cooldown # seconds before a disabled pattern is enabled again, None for never
+        self.filter = filter # notified of slow searches and scales the samples
+        self.timed = 0 # number of timed searches
+        self.timed_total = 0.0
+        self.slow_count = 0
+        self.streak = 0 # slow searches in a row
+        self.disabled = False
+        self.enable_at = None
+
+    def __repr__(self):
+        return '<%s pattern=%r, count=%d, total=%.6f, slow=%d>' % (
+            self.__class__.__name__, self.pattern, self.count, self.total, self.slow_count)
+
+    @property
+    def count(self):
+        """
+        estimated number of searches
+        """
+        return int(self.timed * self.scale())
+
+    @property
+    def total(self):
+        """
+        estimated seconds spent on all searches
+        """
+        return self.timed_total * self.scale()
+
+    def scale(self):
+        return self.filter.scale() if self.filter else 1.0
+
+    def search(self, line):
+        """
+        timed search, return None without searching if disabled
+        """
+        if self.disabled:
+            if self.enable_at is None or default_timer() < self.enable_at:
+                return None
+            self.enable()
+        start = default_timer()
+        m = self.re.search(line)
+        cost = default_timer() - start
+        self.timed += 1
+        self.timed_total += cost
+        if self.slow is not None and cost > self.slow:
+            self.slow_count += 1
+            self.streak += 1
+            logger.warning('%s took %.6fs on a line of %d chars' % (self, cost, len(line)))
+            if self.strikes is not None and self.streak >= self.strikes:
+                self.disable()
+            if self.filter:
+                self.filter.slowed = True
+        else:
+            self.streak = 0
+        return m
+
+    def disable(self):
+        self.disabled = True
+        self.find = lambda line: None
+        if self.cooldown is not None:
+            self.enable_at = default_timer() + self.cooldown
+        self.alert('disable %r after %d slow searches in a row' % (self.pattern, self.streak))
+
+    def enable(self):
+        self.disabled = False
+        self.find = self.re.search
+        self.streak = 0
+        self.enable_at = None
+        self.alert('enable %r' % self.pattern)
+
+    def alert(self, msg):
+        logger.error('%s %s' % (self, msg))
+        if self.filter and self.filter.alert:
+            self.filter.alert(msg)
+
+
 class Filter(object):
     """
     define filter contion by includes and excludes regex
     """
-    def __init__(self, includes, excludes):
+    sample = 64 # time 1 of every sample lines when slow is not given, timing every search is slow
+
+    def __init__(self, includes, excludes, max_length=None, slow=None, strikes=None, cooldown=300,
+                 alert=None):
         self.includes = includes
         self.excludes = excludes
-        self.re_includes = [re.compile(i) for i in includes]
-        self.re_excludes = [re.compile(e) for e in excludes]
+        self.max_length = max_length # only scan the first max_length chars of a line
+        self.timing = slow is not None # time every search to find slow ones
+        self.lines = 0
+        self.timed_lines = 0
+        self.slowed = False # whether a pattern was slow in the current call
+        self.alert = alert # called with a message when a pattern is disabled or enabled
+        self.re_includes = [Pattern(i, slow, strikes, self, cooldown) for i in includes]
+        # excludes are never disabled, otherwise excluded lines would reach handlers
+        self.re_excludes = [Pattern(e, slow, None, self) for e in excludes]
 
     def __call__(self, line):
         """
         return True if the line meets requirements
         """
+        if self.max_length is not None:
+            line = line[:self.max_length]
+        self.lines += 1
+        if self.timing or not self.lines % self.sample:
+            self.timed_lines += 1
+            ok = self.match_timed(line)
+            if self.slowed:
+                self.slowed = False
+                self.isolate()
+            return ok
+        # inlined for speed, the same as match_timed without timing
+        # or
+        m = 1
+        for r in self.re_includes:
+            m = r.find(line)
+            if m:
+                break
+        if m is None:
+            return False
+        # and
+        for r in self.re_excludes:
+            if r.find(line):
+                return False
+        return True
+
+    def scale(self):
+        """
+        ratio of all lines to timed lines
+        """
+        return float(self.lines) / self.timed_lines if self.timed_lines else 0.0
+
+    def match_timed(self, line):
         # or
         m = 1
         for r in self.re_includes:
@@ -127,10 +557,146 @@ class Filter(object):
                 return False
         return True
 
+    def isolate(self):
+        """
+        move slow patterns to the end so that cheap ones are tried first
+        """
+        for patterns in (self.re_includes, self.re_excludes):
+            # sort is stable
+            patterns.sort(key=lambda r: r.slow_count > 0)
+
+    def report(self, top=5):
+        """
+        return the most expensive patterns
+        """
+        patterns = sorted(self.re_includes + self.re_excludes, key=lambda r: r.total, reverse=True)
+        return patterns[:top]
+
     def __repr__(self):
         return '<%s includes=%s, excludes=%s>' % (self.__class__.__name__, self.includes, self.excludes)
 
 
+class Template(object):
+    """
+    a message pattern mined from lines, variable tokens are replaced by wildcards
+    """
+    def __init__(self, id, tokens):
+        self.id = id
+        self.tokens = tokens
+        self.count = 1
+        self.path = [] # [(node, key)] from the root of the tree to the leaf
+
+    def __repr__(self):
+        return '<%s id=%d, count=%d, template=%s>' % (self.__class__.__name__, self.id, self.count, self)
+
+    def __str__(self):
+        return ' '.join(self.tokens)
+
+    def similarity(self, tokens):
+        """
+        return the ratio of identical tokens and the number of wildcards
+        """
+        if not tokens:
+            return 1.0, 0
+        same = params = 0
+        for t1, t2 in zip(self.tokens, tokens):
+            if t1 == Drain.WILDCARD:
+                params += 1
+            elif t1 == t2:
+                same += 1
+        return float(same) / len(tokens), params
+
+    def merge(self, tokens):
+        self.tokens = [t1 if t1 == t2 else Drain.WILDCARD for t1, t2 in zip(self.tokens, tokens)]
+
+    def params(self, line):
+        """
+        return the tokens of a line in the wildcard slots
+        """
+        return [t2 for t1, t2 in zip(self.tokens, line.split()) if t1 == Drain.WILDCARD]
+
+
+class Drain(object):
+    """
+    online log template mining with a fixed depth prefix tree
+    http://jiemingzhu.github.io/pub/pjhe_icws2017.pdf
+    """
+    WILDCARD = '<*>'
+
+    def __init__(self, depth=4, similarity=0.4, max_children=100, max_templates=1000):
+        self.depth = depth # root and length layer are included
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.root = {}
+        self.templates = OrderedDict() # {id: template} least recently used first
+        self.counter = itertools.count(1)
+
+    def __repr__(self):
+        return '<%s templates=%d>' % (self.__class__.__name__, len(self.templates))
+
+    def leaf(self, tokens):
+        """
+        go down the tree by the length and leading tokens of a line
+        create nodes along the way and return (templates in the leaf, path)
+        """
+        keys = [len(tokens)]
+        for token in tokens[:self.depth - 2]:
+            # tokens with digits are likely to be variables
+            keys.append(self.WILDCARD if any(c.isdigit() for c in token) else token)
+        node = self.root
+        path = []
+        for i, key in enumerate(keys):
+            last = i == len(keys) - 1
+            if key not in node:
+                if i > 0 and len(node) >= self.max_children:
+                    key = self.WILDCARD
+                if key not in node:
+                    node[key] = [] if last else {}
+            path.append((node, key))
+            node = node[key]
+        return node, path
+
+    def add(self, line):
+        """
+        return the template of a line and whether it is new
+        """
+        tokens = line.split()
+        leaf, path = self.leaf(tokens)
+        best, best_sim = None, (-1, -1)
+        for t in leaf:
+            sim = t.similarity(tokens)
+            if sim > best_sim:
+                best, best_sim = t, sim
+        if best is not None and best_sim[0] >= self.similarity:
+            best.merge(tokens)
+            best.count += 1
+            # mark as recently used
+            del self.templates[best.id]
+            self.templates[best.id] = best
+            return best, False
+        t = Template(next(self.counter), tokens)
+        t.path = path
+        leaf.append(t)
+        self.templates[t.id] = t
+        if len(self.templates) > self.max_templates:
+            self.evict()
+        return t, True
+
+    def evict(self):
+        """
+        remove the least recently used template and prune empty nodes
+        """
+        id, t = self.templates.popitem(last=False)
+        logger.debug('evict %r' % t)
+        node, key = t.path[-1]
+        node[key].remove(t)
+        for node, key in reversed(t.path):
+            if node[key]:
+                break
+            del node[key]
+
+
 class Handler(object):
     """
     default handler for log event
@@ -193,11 +759,29 @@ class Dog(object):
     2. a filter defined by includes and excludes
     3. a handler function or a callable object
     """
-    def __init__(self, name, paths, handler=Handler(), includes=[], excludes=[]):
+    def __init__(self, name, paths=[], handler=Handler(), includes=[], excludes=[],
+                 min_latency=None, max_latency=None, low_priority=False,
+                 max_length=None, slow=None, strikes=None, cooldown=300, drain=None, notify='lines',
+                 before=0, after=0, sources=[]):
         self.name = name
         self.paths = paths
-        self.filter = Filter(includes, excludes)
+        # urls of non-file sources such as syslog sockets and named pipes
+        self.sources = sources
+        self.filter = Filter(includes, excludes, max_length, slow, strikes, cooldown, self.alert)
         self.handler = handler
+        # seconds between polls of a hot/cold file, default to inteval of LogDogs.run
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        # logs only watched by low priority dogs are skipped when overloaded
+        self.low_priority = low_priority
+        # a dict of arguments for Drain to mine templates from matched lines
+        self.drain = Drain(**drain) if drain is not None else None
+        # what the handler receives: lines, new(first line of new templates) or summary
+        self.notify = notify
+        # number of context lines before and after matched lines like grep
+        self.before = before
+        self.after = after
+        self.contexts = {} # {source: (trailing lines to send, lines since last sent)}
 
     def files(self):
         """
@@ -210,36 +794,311 @@ class Dog(object):
     def __repr__(self):
         return '<%s name=%s>' % (self.__class__.__name__, self.name)
 
-    def process(self, pathname, lines):
+    def process(self, pathname, lines, history=(), source=None):
         """
         process the new lines from a file in a loop
+        history is the lines before them
+        source is the Log object, which differs from pathname after rotation
         """
-        lines = list(filter(self.filter, lines))
-        logger.info('%s process %d lines of %s' % (self, len(lines), pathname))
+        matched = [i for i, line in enumerate(lines) if self.filter(line)]
+        logger.info('%s process %d lines of %s' % (self, len(matched), pathname))
+        selected = [lines[i] for i in matched]
+        if selected and self.drain is not None:
+            selected = self.mine(selected)
+        if (self.before or self.after) and self.notify == 'lines':
+            selected = self.context(pathname if source is None else source, lines, matched, history)
+        lines = selected
         if lines:
             try:
                 self.handler(pathname, lines)
             except:
                 logger.error('\n'+traceback.format_exc())
 
+    def context(self, key, lines, matched, history):
+        """
+        return matched lines with context lines around them
+        overlapping windows are merged and no line is sent twice
+        """
+        pending, gap = self.contexts.get(key, (0, sys.maxsize))
+        # trailing context of last loop
+        keep = set(range(min(pending, len(lines))))
+        for i in matched:
+            keep.update(range(max(0, i - self.before), min(len(lines), i + self.after + 1)))
+        leading = []
+        if matched and matched[0] < self.before:
+            # lines of last loop which have not been sent
+            n = min(self.before - matched[0], gap, len(history))
+            if n:
+                leading = history[-n:]
+        pending = max([pending - len(lines)] + [i + self.after + 1 - len(lines) for i in matched])
+        if keep:
+            gap = len(lines) - 1 - max(keep)
+        else:
+            gap += len(lines)
+        self.contexts[key] = (max(pending, 0), gap)
+        return leading + [lines[i] for i in sorted(keep)]
+
+    def alert(self, msg):
+        """
+        report an event of the dog itself to the handler
+        """
+        try:
+            self.handler('', ['[logdogs] %s %s\n' % (self.name, msg)])
+        except:
+            logger.error('\n'+traceback.format_exc())
+
+    def forget(self, source):
+        """
+        remove the state of a closed source
+        """
+        self.contexts.pop(source, None)
+
+    def mine(self, lines):
+        """
+        map lines to templates and return the lines which the handler subscribes
+        """
+        new = []
+        summary = OrderedDict() # {id: [template, count]}
+        for line in lines:
+            t, created = self.drain.add(line)
+            if created:
+                new.append(line)
+            summary.setdefault(t.id, [t, 0])[1] += 1
+        if self.notify == 'new':
+            return new
+        elif self.notify == 'summary':
+            return ['[%d] %d %s\n' % (t.id, n, t) for t, n in summary.values()]
+        return lines
+
+
+class Overload(object):
+    """
+    degrade in steps when logs are appended faster than they are processed
+    level 0: process all lines
+    level 1: skip logs which are only watched by low priority dogs
+    level 2: sample lines for low priority dogs, only 1 of every `sample` lines is scanned
+    level 3: jump to the end of logs whose backlog exceeds `backlog` bytes
+    other dogs always scan every line that is read so no alert is lost before level 3
+    """
+    SKIP, SAMPLE, JUMP = 1, 2, 3
+
+    def __init__(self, ratio=1.0, backlog=10*1024*1024, sample=10, recover=3, handler=None):
+        self.ratio = ratio # overloaded if processing takes longer than ratio*inteval within an inteval
+        self.backlog = backlog
+        self.sample = sample
+        self.recover = recover # healthy loops before stepping down a level
+        self.handler = handler # called with (file, lines) for each shedding decision
+        self.level = 0
+        self.healthy = 0
+        self.peak = 0 # max backlog seen in current loop
+        self.stats = defaultdict(int) # {metric: count}
+
+    def __repr__(self):
+        return '<%s level=%d>' % (self.__class__.__name__, self.level)
+
+    def report(self, file, msg):
+        """
+        report a shedding decision to logging, metrics and handler
+        """
+        logger.warning('%s %s %s' % (self, msg, file))
+        if self.handler:
+            try:
+                self.handler(file, ['[logdogs] %s\n' % msg])
+            except:
+                logger.error('\n'+traceback.format_exc())
+
+    def shed(self, log):
+        """
+        return the lines of a log to process according to current level
+        """
+        backlog = log.backlog()
+        if self.level >= self.SKIP and backlog and all(dog.low_priority for dog in log.dogs):
+            # not counted in peak, otherwise the level would never go down
+            self.stats['skipped_logs'] += 1
+            self.report(log.path, 'skip low priority log with %d bytes behind' % backlog)
+            return []
+        self.peak = max(self.peak, backlog)
+        if self.level >= self.JUMP and backlog > self.backlog:
+            n = log.skip()
+            self.stats['skipped_bytes'] += n
+            self.report(log.path, 'skip %d bytes' % n)
+        return log.readlines()
+
+    def sample_lines(self, dog, file, lines):
+        """
+        return the lines to be scanned by a dog according to current level
+        """
+        if self.level < self.SAMPLE or self.sample <= 1 or not dog.low_priority:
+            return lines
+        sampled = lines[::self.sample]
+        if len(sampled) < len(lines):
+            self.stats['sampled_lines'] += len(lines) - len(sampled)
+            self.report(file, 'sample %d of %d lines for %s' % (len(sampled), len(lines), dog))
+        return sampled
+
+    def update(self, duration, inteval):
+        """
+        called once in each inteval with the time spent processing to move the level up or down
+        """
+        level = self.level
+        if duration > inteval * self.ratio or self.peak > self.backlog:
+            self.healthy = 0
+            self.level = min(self.level + 1, self.JUMP)
+        else:
+            self.healthy += 1
+            if self.healthy >= self.recover:
+                self.healthy = 0
+                self.level = max(self.level - 1, 0)
+        self.peak = 0
+        self.stats['level'] = self.level
+        if self.level != level:
+            self.report('', 'level %d -> %d after a loop of %.3fs' % (level, self.level, duration))
+
+
+class Probe(object):
+    """
+    measure the latency of detection by appending timestamped canary lines to log files
+    canary lines are recognized and removed before dogs process the lines
+    """
+    PREFIX = '[logdogs canary]'
+    CANARY = re.compile(r'^\[logdogs canary\] \d+ (\d+\.\d+)\n?$')
+
+    def __init__(self, paths=[], file=None, period=60, slo=10, size=1000, handler=None):
+        self.paths = list(paths) # watched log files
+        self.file = file # a dedicated probe file watched by a hidden dog
+        if file:
+            self.paths.append(file)
+            # create it so that it can be watched from now on
+            open(file, 'a').close()
+        self.period = period # seconds between canaries
+        self.slo = slo # seconds, alert if a canary takes longer from written to handled
+        self.handler = handler # called with (file, lines) when slo is exceeded
+        self.last = None
+        self.counter = itertools.count(1)
+        # recent latencies in seconds
+        self.write_read = deque(maxlen=size)
+        self.read_handler = deque(maxlen=size)
+
+    def __repr__(self):
+        return '<%s paths=%s>' % (self.__class__.__name__, self.paths)
+
+    def write(self, now=None):
+        """
+        append a canary line to every path if period has elapsed
+        """
+        if now is None:
+            now = clock()
+        if self.last is not None and now - self.last < self.period:
+            return
+        self.last = now
+        for path in self.paths:
+            flags = os.O_WRONLY | os.O_APPEND
+            if path == self.file:
+                flags |= os.O_CREAT
+            try:
+                # watched logs are never created by the probe, e.g. after being rotated
+                fd = os.open(path, flags, 0o644)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    logger.error('\n'+traceback.format_exc())
+                continue
+            try:
+                line = '%s %d %.6f\n' % (self.PREFIX, next(self.counter), time.time())
+                os.write(fd, line.encode('utf-8'))
+            except OSError:
+                logger.error('\n'+traceback.format_exc())
+            finally:
+                os.close(fd)
+
+    def is_canary(self, line):
+        return line.startswith(self.PREFIX) and self.CANARY.match(line) is not None
+
+    def measure(self, file, line, read):
+        """
+        record the latency of a canary line read at read and handled by now
+        """
+        now = time.time()
+        written = float(self.CANARY.match(line).group(1))
+        self.write_read.append(read - written)
+        self.read_handler.append(now - read)
+        latency = now - written
+        logger.debug('%s %s takes %.6fs' % (self, line.strip(), latency))
+        if latency > self.slo:
+            msg = 'detection latency %.3fs of %s exceeds %.3fs' % (latency, file, self.slo)
+            logger.warning('%s %s' % (self, msg))
+            if self.handler:
+                try:
+                    self.handler(file, ['[logdogs] %s\n' % msg])
+                except:
+                    logger.error('\n'+traceback.format_exc())
+
+    def percentiles(self, qs=(50, 90, 99)):
+        """
+        return {'write_read': {q: seconds}, 'read_handler': {q: seconds}} by nearest rank
+        """
+        result = {}
+        for name in ('write_read', 'read_handler'):
+            values = sorted(getattr(self, name))
+            result[name] = dict(
+                (q, values[max(0, int(math.ceil(q / 100.0 * len(values))) - 1)] if values else None)
+                for q in qs)
+        return result
+
+
+class Scheduler(object):
+    """
+    a priority heap of items ordered by the time they are due
+    """
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count() # break ties in insertion order
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, due, item):
+        heapq.heappush(self.heap, (due, next(self.counter), item))
+
+    def next_due(self):
+        """
+        return the time when the earliest item is due or None if empty
+        """
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now):
+        """
+        a generator to pop all items which are due at now
+        """
+        while self.heap and self.heap[0][0] <= now:
+            yield heapq.heappop(self.heap)[2]
+
+
 class LogDogs(object):
     """
     manager all dogs and logs
     """
-    def __init__(self, DOGS):
+    def __init__(self, DOGS, overload=None, probe=None):
         self.count = 0
         self.logs_map = {} # {path: log object}
         self.old_logs_map = {} # {path: log object}
         self.dogs = []
         self.dogs_map = defaultdict(set) # {path: set([dog object])}
+        self.scheduler = Scheduler()
+        # a dict of arguments for Overload, disabled by default
+        self.overload = Overload(**overload) if overload is not None else None
+        self.busy = 0.0 # seconds spent in poll since last check of newly created log files
+        # a dict of arguments for Probe, disabled by default
+        self.probe = Probe(**probe) if probe is not None else None
 
         # a dirty way to avoid `ResourceWarning: unclosed file` in python3
         atexit.register(self.terminate)
 
         logger.info('start from %s' % os.path.abspath('.'))
 
-        for name, attrs in DOGS.items():
-            dog = Dog(name, **attrs)
+        dogs = [Dog(name, **attrs) for name, attrs in DOGS.items()]
+        if self.probe and self.probe.file:
+            dogs.append(Dog('probe', [self.probe.file]))
+        for dog in dogs:
             self.dogs.append(dog)
             for file in dog.files():
                 if dog not in self.dogs_map[file]:
@@ -247,37 +1106,47 @@ class LogDogs(object):
                 if file not in self.logs_map:
                     log = Log(file, self.dogs_map[file])
                     self.logs_map[file] = log
+            for url in dog.sources:
+                self.dogs_map[url].add(dog)
+                if url not in self.logs_map:
+                    self.logs_map[url] = source(url, self.dogs_map[url])
 
     def do_process(self, log):
         """
         call log's process
         """
         old = log.old
-        n = log.process()
+        n = log.process(self.overload, self.probe)
         if old and n == 0:
             # there is no more log so remove it
             logger.warning('remove %s' % log)
-            self.old_logs_map[log.path].close()
-            del self.old_logs_map[log.path]
+            self.close(self.old_logs_map.pop(log.path))
         elif log.old:
             # move to old_logs
             del self.logs_map[log.path]
             if log.path in self.old_logs_map:
-                self.old_logs_map[log.path].close()
+                self.close(self.old_logs_map[log.path])
             self.old_logs_map[log.path] = log
+        return n
 
-    def process(self):
+    def close(self, log):
         """
-        run every X seconds
-        check current and newly created log files
+        close a log which is no longer watched
         """
-        self.count += 1
-        logger.info('loop %d' % self.count)
+        log.close()
+        for dog in log.dogs:
+            dog.forget(log)
 
-        for log in list(self.logs_map.values()):
-            self.do_process(log)
-        for log in list(self.old_logs_map.values()):
-            self.do_process(log)
+    def watching(self, log):
+        """
+        whether the log is still watched rather than closed
+        """
+        return self.logs_map.get(log.path) is log or self.old_logs_map.get(log.path) is log
+
+    def scan(self):
+        """
+        check newly created log files
+        """
         new_logs = []
         for dog in self.dogs:
             for file in dog.files():
@@ -288,8 +1157,90 @@ class LogDogs(object):
                     log = Log(file, self.dogs_map[file], new=True)
                     self.logs_map[file] = log
                     new_logs.append(log)
-        for log in new_logs:
+        return new_logs
+
+    def process(self):
+        """
+        run every X seconds
+        check current and newly created log files
+        """
+        self.count += 1
+        logger.info('loop %d' % self.count)
+
+        for log in list(self.logs_map.values()):
+            self.do_process(log)
+        for log in list(self.old_logs_map.values()):
             self.do_process(log)
+        for log in self.scan():
+            self.do_process(log)
+        self.flush()
+        if self.probe:
+            self.probe.write()
+
+    def flush(self):
+        """
+        call flush of handlers which buffer lines in a loop
+        handlers sharing the same flush method are flushed once
+        """
+        flushes = []
+        for dog in self.dogs:
+            flush = getattr(dog.handler, 'flush', None)
+            if flush and flush not in flushes:
+                flushes.append(flush)
+        for flush in flushes:
+            try:
+                flush()
+            except:
+                logger.error('\n'+traceback.format_exc())
+
+    def start(self, inteval, now=None):
+        """
+        schedule all logs and the check of newly created log files
+        None in the heap stands for the check
+        """
+        if now is None:
+            now = clock()
+        for log in list(self.logs_map.values()) + list(self.old_logs_map.values()):
+            self.scheduler.push(now + log.reschedule(0, inteval), log)
+        self.scheduler.push(now + inteval, None)
+
+    def poll(self, inteval, now=None):
+        """
+        process the logs which are due
+        hot logs are polled more often than cold ones
+        """
+        start = clock()
+        if now is None:
+            now = start
+        due = []
+        for item in list(self.scheduler.pop_due(now)):
+            if item is None:
+                if self.overload:
+                    # measure the work of an inteval rather than a single wakeup
+                    self.overload.update(self.busy, inteval)
+                    self.busy = 0.0
+                self.count += 1
+                logger.info('loop %d' % self.count)
+                self.scheduler.push(now + inteval, None)
+                # process all logs if the log file is newly created
+                due.extend(self.scan())
+            else:
+                due.append(item)
+        for log in due:
+            if not self.watching(log):
+                # removed after it was scheduled
+                continue
+            n = 0
+            try:
+                n = self.do_process(log)
+            except:
+                logger.error('\n'+traceback.format_exc())
+            if self.watching(log):
+                self.scheduler.push(now + log.reschedule(n, inteval), log)
+        self.flush()
+        if self.probe:
+            self.probe.write()
+        self.busy += clock() - start
 
     def run(self, inteval, daemon=False, pid=None, stdout=None, stderr=None, **kargs):
         """
@@ -307,7 +1258,7 @@ class LogDogs(object):
             # preserve files in python daemon: https://stackoverflow.com/a/13696380/6088837
             fds = set()
             for log in self.logs_map.values():
-                fds.add(log.f.fileno())
+                fds.add(log.fileno())
             for h in logging.root.handlers:
                 if isinstance(h, logging.StreamHandler):
                     fds.add(h.stream.fileno())
@@ -324,15 +1275,338 @@ class LogDogs(object):
                 **kargs)
             context.open()
 
+        self.start(inteval)
         while True:
-            time.sleep(inteval)
+            # wake up when the earliest log is due instead of sleeping inteval
+            time.sleep(max(0, self.scheduler.next_due() - clock()))
             try:
-                self.process()
+                self.poll(inteval)
             except:
                 logger.error('\n'+traceback.format_exc())
 
+    def report(self, top=5):
+        """
+        log and return the most expensive patterns of all dogs
+        """
+        patterns = []
+        for dog in self.dogs:
+            patterns.extend((r, dog) for r in dog.filter.report(top))
+        patterns.sort(key=lambda p: p[0].total, reverse=True)
+        lines = []
+        for r, dog in patterns[:top]:
+            mean = r.total / r.count if r.count else 0
+            lines.append('%s %r: %d searches, %.6fs in total, %.6fs per line, %d slow%s' % (
+                dog, r.pattern, r.count, r.total, mean, r.slow_count, ', disabled' if r.disabled else ''))
+            logger.info(lines[-1])
+        return lines
+
     def terminate(self):
         logger.info('close files')
         for log in self.logs_map.values():
             log.close()
 
+
+
+def pack(obj):
+    """
+    encode an object into a frame of 4 bytes length followed by compressed json
+    """
+    payload = zlib.compress(json.dumps(obj, separators=(',', ':')).encode('utf-8'))
+    return struct.pack('!I', len(payload)) + payload
+
+
+def unpack(buf, max_size):
+    """
+    decode the first complete frame of a bytearray and remove it
+    return None if the frame is incomplete
+    raise ValueError if the frame is corrupt or larger than max_size before or after decompression
+    """
+    if len(buf) < 4:
+        return None
+    n = struct.unpack('!I', bytes(buf[:4]))[0]
+    if n > max_size:
+        raise ValueError('frame of %d bytes is too large' % n)
+    if len(buf) < 4 + n:
+        return None
+    payload = bytes(buf[4:4 + n])
+    del buf[:4 + n]
+    d = zlib.decompressobj()
+    try:
+        data = d.decompress(payload, max_size)
+    except zlib.error as err:
+        raise ValueError(str(err))
+    if d.unconsumed_tail:
+        raise ValueError('frame is larger than %d bytes after decompression' % max_size)
+    obj = json.loads(data.decode('utf-8'))
+    if not valid(obj):
+        raise ValueError('invalid frame')
+    return obj
+
+
+def valid(frame):
+    """
+    check the shape of {'host': host, 'records': [[dog, file, lines]]}
+    """
+    text = type(u'')
+    if not isinstance(frame, dict) or not isinstance(frame.get('host'), text):
+        return False
+    records = frame.get('records')
+    if not isinstance(records, list):
+        return False
+    for record in records:
+        if not (isinstance(record, list) and len(record) == 3
+                and isinstance(record[0], text) and isinstance(record[1], text)
+                and isinstance(record[2], list) and all(isinstance(line, text) for line in record[2])):
+            return False
+    return True
+
+
+class Agent(object):
+    """
+    ship matched lines to a collector over a persistent tcp connection
+    lines of a loop are sent in a batch
+    """
+    def __init__(self, host, port, name=None, batch=1000, max_buffer=100000, timeout=5,
+                 max_retry=60):
+        self.address = (host, port)
+        self.name = name or socket.gethostname()
+        self.batch = batch # send when so many lines are buffered
+        self.max_buffer = max_buffer # drop the oldest lines when collector is down
+        self.timeout = timeout
+        self.max_retry = max_retry # max seconds between reconnects, doubled after each failure
+        self.retry = 0
+        self.next_retry = 0
+        self.conn = None
+        self.buffer = [] # [[dog, file, lines]]
+        self.size = 0 # number of buffered lines
+
+    def __repr__(self):
+        return '<%s name=%s, address=%s:%s>' % (self.__class__.__name__, self.name, self.address[0], self.address[1])
+
+    def handler(self, dog):
+        """
+        return a handler which sends lines of the dog
+        """
+        return AgentHandler(self, dog)
+
+    def put(self, dog, file, lines):
+        self.buffer.append([dog, file, lines])
+        self.size += len(lines)
+        while self.size > self.max_buffer and len(self.buffer) > 1:
+            dropped = self.buffer.pop(0)
+            self.size -= len(dropped[2])
+            logger.warning('%s drop %d lines of %s' % (self, len(dropped[2]), dropped[1]))
+        if self.size >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """
+        send buffered lines, they are kept if the collector is unavailable
+        """
+        if not self.buffer:
+            return
+        if self.conn is not None and self.closed():
+            logger.warning('%s closed by collector' % self)
+            self.close()
+        if self.conn is None and clock() < self.next_retry:
+            return
+        try:
+            if self.conn is None:
+                self.conn = socket.create_connection(self.address, self.timeout)
+                logger.warning('%s connected' % self)
+            self.conn.sendall(pack({'host': self.name, 'records': self.buffer}))
+        except socket.error:
+            self.retry = min(max(self.retry * 2, 1), self.max_retry)
+            self.next_retry = clock() + self.retry
+            logger.error('%s retry in %ds\n%s' % (self, self.retry, traceback.format_exc()))
+            self.close()
+            return
+        self.retry = 0
+        self.buffer = []
+        self.size = 0
+
+    def closed(self):
+        """
+        whether the collector has closed the connection, e.g. restarted
+        a batch sent to a closed connection is lost without any error
+        """
+        self.conn.setblocking(False)
+        try:
+            return not self.conn.recv(1)
+        except socket.error as err:
+            return err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK)
+        finally:
+            self.conn.settimeout(self.timeout)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class AgentHandler(object):
+    """
+    a handler which sends lines to collector by an agent
+    """
+    def __init__(self, agent, dog):
+        self.agent = agent
+        self.dog = dog
+        # shared by all handlers of the agent so that it's flushed once in a loop
+        self.flush = agent.flush
+
+    def __call__(self, file, lines):
+        self.agent.put(self.dog, file, lines)
+
+
+class Collector(object):
+    """
+    receive lines from agents, dedupe them across hosts and call the real handlers
+    a line is delivered once in window seconds no matter how many hosts send it
+    lines are deduped by their templates if drain is given
+    duplicates are summarized when their key expires
+    """
+    def __init__(self, host, port, handlers={}, handler=Handler(), window=60, drain=None,
+                 max_frame=16*1024*1024, max_seen=100000):
+        self.handlers = handlers # {dog name: handler}
+        self.handler = handler # for dogs not in handlers
+        self.window = window
+        self.drain = drain
+        self.drains = {} # {dog name: Drain}
+        self.max_frame = max_frame
+        # {(dog, key): [delivered time, set of hosts, count, file, line]} earliest delivered first
+        self.seen = OrderedDict()
+        self.max_seen = max_seen
+        self.clients = {} # {socket: bytearray}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+        logger.info('start %s' % self)
+
+    def __repr__(self):
+        return '<%s address=%s:%s>' % ((self.__class__.__name__,) + self.sock.getsockname()[:2])
+
+    def receive(self):
+        """
+        return frames received from all agents without blocking
+        """
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error as err:
+                if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            logger.info('%s accept %s' % (self, addr))
+            conn.setblocking(False)
+            self.clients[conn] = bytearray()
+        frames = []
+        for conn, buf in list(self.clients.items()):
+            while True:
+                try:
+                    data = conn.recv(65536)
+                except socket.error as err:
+                    if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    data = b''
+                if not data:
+                    logger.info('%s disconnected' % self)
+                    del self.clients[conn]
+                    conn.close()
+                    break
+                buf.extend(data)
+                try:
+                    while True:
+                        frame = unpack(buf, self.max_frame)
+                        if frame is None:
+                            break
+                        frames.append(frame)
+                except ValueError:
+                    # only the client sending the corrupt frame is dropped
+                    logger.error('%s drop client %s\n%s' % (self, conn.fileno(), traceback.format_exc()))
+                    del self.clients[conn]
+                    conn.close()
+                    break
+        return frames
+
+    def key(self, dog, line):
+        """
+        lines with the same key are duplicates
+        """
+        if self.drain is None:
+            return line
+        if dog not in self.drains:
+            self.drains[dog] = Drain(**self.drain)
+        return self.drains[dog].add(line)[0].id
+
+    def process(self, now=None):
+        """
+        run every X seconds
+        call handlers with lines which are not delivered in window
+        """
+        if now is None:
+            now = clock()
+        summaries = OrderedDict() # {(dog, file): [hosts, lines]}
+        while self.seen:
+            k = next(iter(self.seen))
+            if now - self.seen[k][0] < self.window:
+                break
+            self.forget(k, summaries)
+        batches = OrderedDict() # {(dog, file): [keys, lines]}
+        for frame in self.receive():
+            host = frame['host']
+            for dog, file, lines in frame['records']:
+                for line in lines:
+                    k = (dog, self.key(dog, line))
+                    if k in self.seen:
+                        self.seen[k][1].add(host)
+                        self.seen[k][2] += 1
+                        continue
+                    self.seen[k] = [now, set([host]), 1, file, line]
+                    batch = batches.setdefault((dog, file), [[], []])
+                    batch[0].append(k)
+                    batch[1].append(line)
+        for (dog, file), (keys, lines) in batches.items():
+            # including hosts which sent duplicates later in this loop
+            hosts = set()
+            for k in keys:
+                hosts.update(self.seen[k][1])
+            self.deliver(dog, file, hosts, lines)
+        # evicted after delivering since hosts of the batches are looked up
+        while len(self.seen) > self.max_seen:
+            self.forget(next(iter(self.seen)), summaries)
+        for (dog, file), (hosts, lines) in summaries.items():
+            self.deliver(dog, file, hosts, lines)
+
+    def forget(self, k, summaries):
+        """
+        remove a key and add a summary of its duplicates which were not delivered
+        """
+        delivered, hosts, count, file, line = self.seen.pop(k)
+        if count > 1:
+            summary = summaries.setdefault((k[0], file), [set(), []])
+            summary[0].update(hosts)
+            summary[1].append('[logdogs] %d duplicates of %s' % (count - 1, line))
+
+    def deliver(self, dog, file, hosts, lines):
+        handler = self.handlers.get(dog, self.handler)
+        logger.info('%s process %d lines of %s from %d hosts' % (self, len(lines), file, len(hosts)))
+        try:
+            handler('%s:%s' % (','.join(sorted(hosts)), file), lines)
+        except:
+            logger.error('\n'+traceback.format_exc())
+
+    def run(self, inteval):
+        while True:
+            time.sleep(inteval)
+            try:
+                self.process()
+            except:
+                logger.error('\n'+traceback.format_exc())
+
+    def close(self):
+        for conn in self.clients:
+            conn.close()
+        self.clients = {}
+        self.sock.close()
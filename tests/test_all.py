@@ -7,6 +7,10 @@ import unittest
 import shutil
 import subprocess
 import signal
+import socket
+import struct
+import zlib
+import time
 from time import sleep
 
 if sys.version_info[0] > 2:
@@ -14,7 +18,7 @@ if sys.version_info[0] > 2:
 else:
     from Queue import Queue
 
-from logdogs import LogDogs
+from logdogs import LogDogs, Agent, Collector, clock
 
 
 logging.basicConfig(
@@ -25,10 +29,11 @@ logging.basicConfig(
 
 class Common(object):
     def rm(self, path):
-        if os.path.isfile(path):
-            os.remove(path)
-        elif os.path.isdir(path):
+        if os.path.isdir(path):
             shutil.rmtree(path)
+        elif os.path.lexists(path):
+            # also named pipes and sockets
+            os.remove(path)
 
     def see(self, file, keywords):
         """check the file for keyword in the given order
@@ -391,6 +396,733 @@ class TestFunction(unittest.TestCase, Common):
         logdogs.process()
         self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
 
+    def test_adaptive(self):
+        """
+        a cold log backs off exponentially and a hot log is polled at min latency
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler,
+                'min_latency': 1,
+                'max_latency': 4
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+        log = logdogs.logs_map['a.log']
+        logdogs.start(10, now=0)
+        self.assertEqual(logdogs.scheduler.next_due(), 1)
+
+        for now, interval in [(1, 2), (3, 4)]:
+            logdogs.poll(10, now=now)
+            self.assertEqual(log.interval, interval)
+            self.assertEqual(logdogs.scheduler.next_due(), now + interval)
+        logdogs.poll(10, now=7)
+        # capped by max latency
+        self.assertEqual(log.interval, 4)
+
+        self.write(f, 'something wrong\n')
+        # only check newly created log files
+        logdogs.poll(10, now=10)
+        self.assertTrue(self.q.empty())
+        logdogs.poll(10, now=11)
+        self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+        self.assertEqual(log.interval, 1)
+        self.assertEqual(logdogs.count, 1)
+
+    def test_adaptive_new_file(self):
+        """
+        newly created log files are checked every inteval
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler
+            }
+        }
+        logdogs = LogDogs(DOGS)
+        logdogs.start(5, now=0)
+        f = self.open('a.log')
+        self.write(f, 'something wrong\n')
+        logdogs.poll(5, now=4)
+        self.assertTrue(self.q.empty())
+        logdogs.poll(5, now=5)
+        self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+        self.assertEqual(logdogs.logs_map['a.log'].interval, 5)
+
+    def test_schedule_clock(self):
+        """
+        schedules use the monotonic clock rather than the system time
+        """
+        logdogs = LogDogs({'test': {'paths': ['a.log'], 'handler': self.handler}})
+        start = clock()
+        logdogs.start(5)
+        self.assertTrue(start + 5 <= logdogs.scheduler.next_due() <= clock() + 5)
+        if hasattr(time, 'monotonic'):
+            self.assertIs(clock, time.monotonic)
+
+    def test_overload(self):
+        """
+        skip low priority logs, sample lines for low priority dogs and jump to the end in steps when overloaded
+        """
+        reports = []
+        low = []
+        DOGS = {
+            'high': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler
+            },
+            'low': {
+                'paths': ['a.log', 'b.log'],
+                'includes': ['wrong'],
+                'handler': lambda file, lines: low.append((file, lines)),
+                'low_priority': True
+            }
+        }
+        fa = self.open('a.log')
+        fb = self.open('b.log')
+        logdogs = LogDogs(DOGS, overload={
+            'backlog': 100,
+            'sample': 2,
+            'recover': 1,
+            'handler': lambda file, lines: reports.append((file, lines))
+        })
+        overload = logdogs.overload
+        logdogs.start(1, now=0)
+
+        # a loop slower than inteval steps up
+        overload.update(2, 1)
+        self.assertEqual(overload.level, 1)
+        self.assertEqual(reports.pop(), ('', ['[logdogs] level 0 -> 1 after a loop of 2.000s\n']))
+
+        self.write(fa, 'wrong 1\nwrong 2\nwrong 3\n')
+        self.write(fb, 'wrong b\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['wrong 1\n', 'wrong 2\n', 'wrong 3\n'])
+        self.assertEqual(low.pop(), ('a.log', ['wrong 1\n', 'wrong 2\n', 'wrong 3\n']))
+        self.assertEqual(overload.stats['skipped_logs'], 1)
+        self.assertEqual(reports.pop()[0], 'b.log')
+
+        # matched lines are never sampled for other dogs
+        overload.level = 2
+        self.write(fa, 'wrong 1\nwrong 2\nwrong 3\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['wrong 1\n', 'wrong 2\n', 'wrong 3\n'])
+        self.assertEqual(low.pop(), ('a.log', ['wrong 1\n', 'wrong 3\n']))
+        self.assertEqual(overload.stats['sampled_lines'], 1)
+        self.assertIn('a.log', [file for file, lines in reports])
+        del reports[:]
+
+        overload.level = 3
+        self.write(fa, 'wrong\n' * 20)
+        self.write(fa, 'wrong\n')
+        logdogs.process()
+        self.assertEqual(overload.stats['skipped_bytes'], 126)
+        self.assertIn(('a.log', ['[logdogs] skip 126 bytes\n']), reports)
+        self.assertTrue(self.q.empty())
+        self.assertEqual(low, [])
+
+        # the large backlog seen in last loop still counts
+        overload.update(0, 1)
+        self.assertEqual(overload.level, 3)
+        # a healthy loop steps down
+        overload.update(0, 1)
+        self.assertEqual(overload.level, 2)
+        self.assertEqual(overload.stats['level'], 2)
+
+    def test_overload_recover(self):
+        """
+        the backlog of a skipped low priority log doesn't keep the level up
+        """
+        DOGS = {
+            'high': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler
+            },
+            'low': {
+                'paths': ['b.log'],
+                'includes': ['wrong'],
+                'handler': self.handler,
+                'low_priority': True
+            }
+        }
+        self.open('a.log')
+        fb = self.open('b.log')
+        logdogs = LogDogs(DOGS, overload={'backlog': 100, 'recover': 1})
+        overload = logdogs.overload
+        overload.level = 1
+        self.write(fb, 'x' * 399 + '\n')
+        for i in range(3):
+            logdogs.process()
+            overload.update(0, 1)
+        self.assertEqual(overload.level, 0)
+        self.assertEqual(overload.stats['skipped_logs'], 1)
+        # read at level 0
+        logdogs.process()
+        self.assertEqual(logdogs.logs_map['b.log'].backlog(), 0)
+
+    def test_overload_inteval(self):
+        """
+        the level is updated once in an inteval however often logs are polled
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'handler': self.handler,
+                'min_latency': 1
+            }
+        }
+        self.open('a.log')
+        logdogs = LogDogs(DOGS, overload={'recover': 1})
+        overload = logdogs.overload
+        overload.level = 1
+        logdogs.start(10, now=0)
+        for now in range(1, 10):
+            logdogs.poll(10, now=now)
+        self.assertEqual(overload.level, 1)
+        logdogs.poll(10, now=10)
+        self.assertEqual(overload.level, 0)
+
+    def test_pattern_cost(self):
+        """
+        slow patterns are tried last and disabled after too many slow searches in a row
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wr(o+)+ng', 'bad'],
+                'handler': self.handler,
+                'max_length': 20,
+                'slow': -1,
+                'strikes': 2
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+        flt = logdogs.dogs[0].filter
+
+        self.write(f, 'something wrong\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+        self.assertEqual([r.pattern for r in flt.re_includes], ['bad', 'wr(o+)+ng'])
+
+        # only the first max_length chars are scanned
+        self.write(f, 'x' * 20 + ' wrong\n')
+        logdogs.process()
+        # the disable is reported to handler
+        self.assertEqual(self.q.get_nowait(),
+            ["[logdogs] test disable 'wr(o+)+ng' after 2 slow searches in a row\n"])
+
+        self.write(f, 'bad\nwrong\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ["[logdogs] test disable 'bad' after 2 slow searches in a row\n"])
+        self.assertEqual(self.q.get_nowait(), ['bad\n'])
+        self.assertTrue(all(r.disabled for r in flt.re_includes))
+
+        report = logdogs.report(1)
+        self.assertEqual(len(report), 1)
+        self.assertIn('disabled', report[0])
+
+        # enabled again after cooldown
+        for r in flt.re_includes:
+            r.enable_at = 0
+            r.slow = None
+        self.write(f, 'wrong\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ["[logdogs] test enable 'bad'\n"])
+        self.assertEqual(self.q.get_nowait(), ["[logdogs] test enable 'wr(o+)+ng'\n"])
+        self.assertEqual(self.q.get_nowait(), ['wrong\n'])
+
+    def test_pattern_streak(self):
+        """
+        a fast search resets the slow streak
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler,
+                'slow': -1,
+                'strikes': 2
+            }
+        }
+        logdogs = LogDogs(DOGS)
+        r = logdogs.dogs[0].filter.re_includes[0]
+        r.search('hello')
+        r.slow = 10
+        r.search('hello')
+        r.slow = -1
+        r.search('hello')
+        self.assertFalse(r.disabled)
+        self.assertEqual(r.slow_count, 2)
+
+    def test_pattern_sample(self):
+        """
+        searches are timed by sampling unless slow is given
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+        flt = logdogs.dogs[0].filter
+
+        self.write(f, 'hello world\n' * 128)
+        logdogs.process()
+        self.assertEqual(flt.timed_lines, 2)
+        self.assertEqual(flt.re_includes[0].count, 128)
+        self.assertTrue(flt.re_includes[0].total > 0)
+
+    def test_pattern_exclude_strikes(self):
+        """
+        a slow exclude is never disabled
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'excludes': ['long'],
+                'handler': self.handler,
+                'slow': -1,
+                'strikes': 1
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+
+        self.write(f, 'a long wrong answer\nanother long wrong answer\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ["[logdogs] test disable 'wrong' after 1 slow searches in a row\n"])
+        self.assertFalse(logdogs.dogs[0].filter.re_excludes[0].disabled)
+
+    def test_drain(self):
+        """
+        similar lines are clustered into templates
+        """
+        DOGS = {
+            'new': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler,
+                'drain': {'max_templates': 2},
+                'notify': 'new'
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+        drain = logdogs.dogs[0].drain
+
+        self.write(f, 'user 1 is wrong\nuser 2 is wrong\nuser 3 is wrong\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['user 1 is wrong\n'])
+        t = drain.templates[1]
+        self.assertEqual(str(t), 'user <*> is wrong')
+        self.assertEqual(t.count, 3)
+        self.assertEqual(t.params('user 4 is wrong\n'), ['4'])
+
+        self.write(f, 'user 4 is wrong\nwrong password 12\nwrong password 34\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['wrong password 12\n'])
+
+        # memory is bounded by max_templates
+        self.write(f, 'what is wrong\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['what is wrong\n'])
+        self.assertEqual(list(drain.templates), [2, 3])
+        self.assertNotIn(4, drain.root)
+
+    def test_drain_summary(self):
+        """
+        handler receives a summary per template
+        """
+        DOGS = {
+            'summary': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler,
+                'drain': {},
+                'notify': 'summary'
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+
+        self.write(f, 'wrong disk sda\nwhat is wrong\nwrong disk sdb\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['[1] 2 wrong disk <*>\n', '[2] 1 what is wrong\n'])
+
+    def test_context(self):
+        """
+        context lines before and after matched lines like grep -B -A
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler,
+                'before': 2,
+                'after': 1
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+
+        self.write(f, '1\n2\n3\n')
+        logdogs.process()
+        self.assertTrue(self.q.empty())
+
+        # leading context comes from last loop
+        self.write(f, 'wrong 4\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['2\n', '3\n', 'wrong 4\n'])
+
+        # trailing context is sent in next loop and windows are merged
+        self.write(f, '5\nwrong 6\n7\n8\n9\n10\nwrong 11\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(),
+            ['5\n', 'wrong 6\n', '7\n', '9\n', '10\n', 'wrong 11\n'])
+
+        self.write(f, '12\n13\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['12\n'])
+
+        # 13 has been read but not sent
+        self.write(f, 'wrong 14\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['13\n', 'wrong 14\n'])
+
+    def test_sources(self):
+        """
+        lines can be received from syslog sockets and named pipes
+        """
+        udp = 'udp://127.0.0.1:0'
+        tcp = 'tcp://127.0.0.1:0'
+        unix = 'unix://logdogs.sock'
+        fifo = 'fifo://logdogs.fifo'
+        DOGS = {
+            'test': {
+                'sources': [udp, tcp, unix, fifo],
+                'includes': ['wrong'],
+                'handler': lambda file, lines: self.q.put([file, lines])
+            }
+        }
+        logdogs = LogDogs(DOGS)
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.sendto(b'<11>udp is wrong', logdogs.logs_map[udp].sock.getsockname())
+            s.close()
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            s.sendto(b'<11>unix is wrong\n', 'logdogs.sock')
+            s.close()
+            conn = socket.create_connection(logdogs.logs_map[tcp].sock.getsockname())
+            conn.sendall(b'<11>tcp is wrong\nhello\n<11>half wr')
+            fd = os.open('logdogs.fifo', os.O_WRONLY)
+            os.write(fd, b'fifo is wrong\n')
+            sleep(.1)
+            logdogs.process()
+            lines = [self.q.get_nowait() for i in range(4)]
+            self.assertIn([udp, ['<11>udp is wrong\n']], lines)
+            self.assertIn([tcp, ['<11>tcp is wrong\n']], lines)
+            self.assertIn([unix, ['<11>unix is wrong\n']], lines)
+            self.assertIn([fifo, ['fifo is wrong\n']], lines)
+
+            conn.sendall(b'ong\n')
+            sleep(.1)
+            logdogs.process()
+            self.assertEqual(self.q.get_nowait(), [tcp, ['<11>half wrong\n']])
+            conn.close()
+            os.close(fd)
+        finally:
+            logdogs.terminate()
+        self.assertFalse(os.path.exists('logdogs.sock'))
+        self.rm('logdogs.fifo')
+
+    def test_sources_guard(self):
+        """
+        only stale unix sockets are removed and the rest of a long line is discarded
+        """
+        self.open('logdogs.sock')
+        DOGS = {
+            'test': {
+                'sources': ['unix://logdogs.sock'],
+                'handler': self.handler
+            }
+        }
+        self.assertRaises(ValueError, LogDogs, DOGS)
+        self.assertTrue(os.path.isfile('logdogs.sock'))
+        self.rm('logdogs.sock')
+
+        DOGS = {
+            'test': {
+                'sources': ['fifo://logdogs.fifo'],
+                'includes': ['wrong'],
+                'handler': self.handler
+            }
+        }
+        logdogs = LogDogs(DOGS)
+        log = logdogs.logs_map['fifo://logdogs.fifo']
+        log.max_line = 8
+        fd = os.open('logdogs.fifo', os.O_WRONLY)
+        try:
+            os.write(fd, b'long long ')
+            logdogs.process()
+            self.assertTrue(self.q.empty())
+            os.write(fd, b'long wrong\nwrong\n')
+            logdogs.process()
+            self.assertEqual(self.q.get_nowait(), ['wrong\n'])
+        finally:
+            os.close(fd)
+            logdogs.terminate()
+            self.rm('logdogs.fifo')
+
+    def test_probe(self):
+        """
+        canary lines are hidden from handlers and their latency is measured
+        """
+        alerts = []
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'handler': self.handler
+            }
+        }
+        self.rm('probe.log')
+        self.open('a.log')
+        # canaries are appended by another file object
+        f = open('a.log', 'a')
+        self.files.append(f)
+        logdogs = LogDogs(DOGS, probe={
+            'paths': ['a.log'],
+            'file': 'probe.log',
+            'period': 0,
+            'slo': -1,
+            'handler': lambda file, lines: alerts.append(file)
+        })
+        self.assertIn('probe.log', logdogs.logs_map)
+
+        # canaries are written at the end of a loop
+        logdogs.process()
+        self.assertEqual(alerts, [])
+        self.write(f, 'hello\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['hello\n'])
+        self.assertEqual(sorted(alerts), ['a.log', 'probe.log'])
+
+        # lines looking like canaries are passed to dogs
+        self.write(f, '[logdogs canary] user message\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['[logdogs canary] user message\n'])
+
+        # a watched log which doesn't exist is not created
+        self.rm('b.log')
+        logdogs.probe.paths.append('b.log')
+        logdogs.probe.write()
+        self.assertFalse(os.path.exists('b.log'))
+
+        percentiles = logdogs.probe.percentiles()
+        self.assertEqual(len(logdogs.probe.write_read), 4)
+        self.assertTrue(percentiles['write_read'][99] >= percentiles['write_read'][50] >= 0)
+        self.assertTrue(percentiles['read_handler'][50] >= 0)
+        self.rm('probe.log')
+
+    def test_collector(self):
+        """
+        lines from multiple agents are deduped by collector
+        """
+        collector = Collector('127.0.0.1', 0, {'test': self.handler}, window=60)
+        host, port = collector.sock.getsockname()
+        f1 = self.open('a.log')
+        f2 = self.open('b.log')
+        agents = []
+        logdogs = []
+        for name, path in [('host1', 'a.log'), ('host2', 'b.log')]:
+            agent = Agent(host, port, name=name)
+            agents.append(agent)
+            logdogs.append(LogDogs({
+                'test': {
+                    'paths': [path],
+                    'includes': ['wrong'],
+                    'handler': agent.handler('test')
+                }
+            }))
+        try:
+            self.write(f1, 'something wrong\n')
+            self.write(f2, 'something wrong\nwhats wrong\n')
+            logdogs[0].process()
+            logdogs[1].process()
+            sleep(.1)
+            collector.process(now=0)
+            self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+            self.assertEqual(self.q.get_nowait(), ['whats wrong\n'])
+            self.assertEqual(collector.seen[('test', 'something wrong\n')][1:3], [set(['host1', 'host2']), 2])
+
+            # delivered again after window
+            self.write(f1, 'something wrong\n')
+            logdogs[0].process()
+            sleep(.1)
+            collector.process(now=30)
+            self.assertTrue(self.q.empty())
+            self.write(f1, 'something wrong\n')
+            logdogs[0].process()
+            sleep(.1)
+            collector.process(now=60)
+            self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+            # duplicates of the expired key are summarized
+            self.assertEqual(self.q.get_nowait(), ['[logdogs] 2 duplicates of something wrong\n'])
+        finally:
+            for agent in agents:
+                agent.close()
+            collector.close()
+
+    def test_collector_max_seen(self):
+        """
+        the earliest delivered keys are evicted beyond max_seen and their duplicates are summarized
+        """
+        files = []
+        collector = Collector('127.0.0.1', 0, handler=lambda file, lines: files.append(file) or self.q.put(lines),
+                              max_seen=2)
+        frames = []
+        collector.receive = lambda: frames
+        try:
+            frames[:] = [
+                {'host': 'host1', 'records': [['test', 'a.log', ['a\n', 'b\n']]]},
+                {'host': 'host2', 'records': [['test', 'a.log', ['a\n']]]}
+            ]
+            collector.process(now=0)
+            self.assertEqual(self.q.get_nowait(), ['a\n', 'b\n'])
+            frames[:] = [{'host': 'host3', 'records': [['test', 'b.log', ['c\n']]]}]
+            collector.process(now=1)
+            self.assertEqual(self.q.get_nowait(), ['c\n'])
+            self.assertEqual(self.q.get_nowait(), ['[logdogs] 1 duplicates of a\n'])
+            self.assertEqual(files, ['host1,host2:a.log', 'host3:b.log', 'host1,host2:a.log'])
+            self.assertEqual(list(collector.seen), [('test', 'b\n'), ('test', 'c\n')])
+        finally:
+            collector.close()
+
+    def test_collector_corrupt(self):
+        """
+        an agent sending corrupt frames doesn't affect others
+        """
+        collector = Collector('127.0.0.1', 0, {'test': self.handler}, max_frame=1000)
+        address = collector.sock.getsockname()
+        agent = Agent(address[0], address[1], name='host1')
+        bad = socket.create_connection(address)
+        bomb = socket.create_connection(address)
+        try:
+            sleep(.1)
+            collector.process()
+            bad.sendall(struct.pack('!I', 3) + b'xyz')
+            payload = zlib.compress(b' ' * 10000)
+            bomb.sendall(struct.pack('!I', len(payload)) + payload)
+            agent.put('test', 'a.log', ['something wrong\n'])
+            agent.flush()
+            sleep(.1)
+            collector.process()
+            self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+            self.assertEqual(len(collector.clients), 1)
+        finally:
+            bad.close()
+            bomb.close()
+            agent.close()
+            collector.close()
+
+    def test_agent_reconnect(self):
+        """
+        an agent reconnects before sending if the collector has restarted
+        """
+        collector = Collector('127.0.0.1', 0, {'test': self.handler})
+        address = collector.sock.getsockname()
+        agent = Agent(address[0], address[1], name='host1')
+        try:
+            agent.put('test', 'a.log', ['something wrong\n'])
+            agent.flush()
+            sleep(.1)
+            collector.process()
+            self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+
+            collector.close()
+            collector = Collector(address[0], address[1], {'test': self.handler})
+            sleep(.1)
+            agent.put('test', 'a.log', ['whats wrong\n'])
+            agent.flush()
+            sleep(.1)
+            collector.process()
+            self.assertEqual(self.q.get_nowait(), ['whats wrong\n'])
+        finally:
+            agent.close()
+            collector.close()
+
+    def test_agent_retry(self):
+        """
+        an agent backs off reconnecting to an unavailable collector and is flushed once in a loop
+        """
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        address = s.getsockname()
+        # nothing is listening
+        s.close()
+        agent = Agent(address[0], address[1], name='host1')
+        connects = []
+        create_connection = socket.create_connection
+        def connect(*args):
+            connects.append(args)
+            return create_connection(*args)
+        socket.create_connection = connect
+        try:
+            logdogs = LogDogs({
+                'test1': {'paths': ['a.log'], 'includes': ['wrong'], 'handler': agent.handler('test1')},
+                'test2': {'paths': ['a.log'], 'includes': ['wrong'], 'handler': agent.handler('test2')}
+            })
+            f = self.open('a.log')
+            self.write(f, 'something wrong\n')
+            logdogs.process()
+            self.assertEqual(len(connects), 1)
+            self.assertEqual(agent.retry, 1)
+            logdogs.process()
+            self.assertEqual(len(connects), 1)
+            self.assertEqual(agent.size, 2)
+        finally:
+            socket.create_connection = create_connection
+            agent.close()
+
+    def test_context_rotate(self):
+        """
+        trailing context of a rotated log is not applied to the new log
+        """
+        DOGS = {
+            'test': {
+                'paths': ['a.log'],
+                'includes': ['wrong'],
+                'handler': self.handler,
+                'after': 2
+            }
+        }
+        f = self.open('a.log')
+        logdogs = LogDogs(DOGS)
+
+        self.write(f, 'something wrong\n')
+        logdogs.process()
+        self.assertEqual(self.q.get_nowait(), ['something wrong\n'])
+
+        shutil.move('a.log', 'b.log')
+        f = self.open('a.log')
+        self.write(f, 'new 1\nnew 2\n')
+        logdogs.process()
+        self.assertTrue(self.q.empty())
+
+        # the rotated log is removed with its state
+        logdogs.process()
+        self.assertEqual(list(logdogs.dogs[0].contexts), [logdogs.logs_map['a.log']])
+
 
 class TestAcceptance(unittest.TestCase, Common):
     def setUp(self):